@@ -5,38 +5,71 @@ Agent uses the containerized Lambda for action execution.
 """
 
 import json
-import boto3
 import os
+import time
 from datetime import datetime
 
+from clients import get_client
+
+# Clients are created once per execution environment and reused across warm
+# invocations so their connection pools survive between events.
+_BEDROCK = get_client('bedrock-agent')
+_ECR = get_client('ecr')
+_LAMBDA = get_client('lambda')
+_S3 = get_client('s3')
+
+# Configuration is fixed for the life of the execution environment
+_BUCKET = os.environ['S3_BUCKET']
+_REPO = os.environ['ECR_REPO']
+_AGENT_ROLE_ARN = os.environ['AGENT_ROLE_ARN']
+_REGION = os.environ['AWS_REGION']
+
+def wait_for_agent(bedrock, agent_id, max_attempts=30):
+    """Poll until the agent leaves the CREATING state."""
+    for attempt in range(max_attempts):
+        status = bedrock.get_agent(agentId=agent_id)['agent']['agentStatus']
+        if status in ('NOT_PREPARED', 'PREPARED'):
+            return status
+        if status == 'FAILED':
+            raise RuntimeError(f"Agent {agent_id} failed to create")
+        time.sleep(min(2 ** attempt, 4))
+    raise TimeoutError(f"Agent {agent_id} not ready, last status: {status}")
+
+def latest_image_digest(ecr, repo_name):
+    """Return the digest of the most recently pushed tagged image, or None."""
+    latest = None
+    paginator = ecr.get_paginator('describe_images')
+    for page in paginator.paginate(repositoryName=repo_name, filter={'tagStatus': 'TAGGED'}):
+        for image in page['imageDetails']:
+            if latest is None or image['imagePushedAt'] > latest['imagePushedAt']:
+                latest = image
+    return latest['imageDigest'] if latest else None
+
 def lambda_handler(event, context):
     """
     Triggered by EventBridge when ECR image is pushed.
     Creates a new Bedrock Agent with Lambda action group.
     """
     
-    bedrock = boto3.client('bedrock-agent')
-    ecr = boto3.client('ecr')
-    lambda_client = boto3.client('lambda')
-    iam = boto3.client('iam')
+    bedrock = _BEDROCK
+    ecr = _ECR
+    lambda_client = _LAMBDA
     
-    bucket = os.environ['S3_BUCKET']
-    repo_name = os.environ['ECR_REPO']
-    agent_role_arn = os.environ['AGENT_ROLE_ARN']
+    bucket = _BUCKET
+    repo_name = _REPO
+    agent_role_arn = _AGENT_ROLE_ARN
     
     account_id = context.invoked_function_arn.split(':')[4]
-    region = os.environ['AWS_REGION']
+    region = _REGION
     
-    # Get latest image
-    images = ecr.describe_images(
-        repositoryName=repo_name,
-        maxResults=1
-    )
+    # ECR push events carry the digest; only query ECR if it is missing
+    image_digest = event.get('detail', {}).get('image-digest')
+    if not image_digest:
+        image_digest = latest_image_digest(ecr, repo_name)
     
-    if not images['imageDetails']:
+    if not image_digest:
         return {'statusCode': 400, 'body': 'No images found'}
     
-    image_digest = images['imageDetails'][0]['imageDigest']
     image_uri = f"{account_id}.dkr.ecr.{region}.amazonaws.com/{repo_name}@{image_digest}"
     
     timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
@@ -44,9 +77,10 @@ def lambda_handler(event, context):
     # Update/Create Lambda with new image
     lambda_function_name = 'AgentCoreToolExecutor'
     try:
-        lambda_client.update_function_code(
+        update_response = lambda_client.update_function_code(
             FunctionName=lambda_function_name,
-            ImageUri=image_uri
+            ImageUri=image_uri,
+            Architectures=['arm64']
         )
         print(f"✓ Updated Lambda: {lambda_function_name}")
     except lambda_client.exceptions.ResourceNotFoundException:
@@ -54,11 +88,13 @@ def lambda_handler(event, context):
         print(f"⚠️  Lambda not found: {lambda_function_name}")
         return {'statusCode': 400, 'body': 'Lambda not found'}
     
-    lambda_arn = lambda_client.get_function(FunctionName=lambda_function_name)['Configuration']['FunctionArn']
+    lambda_arn = update_response['FunctionArn']
     
-    # Wait for Lambda to be ready
-    import time
-    time.sleep(5)
+    # Wait for Lambda update to finish
+    lambda_client.get_waiter('function_updated_v2').wait(
+        FunctionName=lambda_function_name,
+        WaiterConfig={'Delay': 1, 'MaxAttempts': 30}
+    )
     
     # Create new Bedrock Agent
     agent_name = f"agent-core-{timestamp}"
@@ -75,8 +111,8 @@ def lambda_handler(event, context):
     agent_id = agent_response['agent']['agentId']
     print(f"✓ Created agent: {agent_id}")
     
-    # Wait for agent to be ready
-    time.sleep(10)
+    # Wait for agent to be ready (Bedrock Agents has no waiter)
+    wait_for_agent(bedrock, agent_id)
     
     # Add action group with Lambda
     bedrock.create_agent_action_group(
@@ -143,18 +179,22 @@ def lambda_handler(event, context):
         "created_at": timestamp
     }
     
-    s3 = boto3.client('s3')
+    s3 = _S3
+    agent_key = f'agents/agent-{timestamp}.json'
+    body = json.dumps(agent_info, separators=(',', ':'))
     s3.put_object(
         Bucket=bucket,
-        Key=f'agents/agent-{timestamp}.json',
-        Body=json.dumps(agent_info, indent=2),
+        Key=agent_key,
+        Body=body,
         ContentType='application/json'
     )
     
-    s3.put_object(
+    # Server-side copy avoids uploading the same body twice
+    s3.copy_object(
         Bucket=bucket,
         Key='agents/latest.json',
-        Body=json.dumps(agent_info, indent=2),
+        CopySource={'Bucket': bucket, 'Key': agent_key},
+        MetadataDirective='REPLACE',
         ContentType='application/json'
     )
     
@@ -0,0 +1,18 @@
+"""Shared boto3 clients with a common connection and retry config"""
+
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+
+# Larger connection pool, TCP keepalive and adaptive retries for every client
+_CFG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 10}
+)
+
+@lru_cache(maxsize=None)
+def get_client(service, region=None):
+    """Return a memoized client for `service`, built once per process"""
+    return boto3.client(service, region_name=region, config=_CFG)
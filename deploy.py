@@ -6,27 +6,36 @@ import zipfile
 from io import BytesIO
 import time
 import os
+import random
+from botocore.exceptions import ClientError
+
+from clients import get_client
 
 def deploy():
-    s3 = boto3.client('s3')
-    codebuild = boto3.client('codebuild')
-    lambda_client = boto3.client('lambda')
-    ecr = boto3.client('ecr')
+    s3 = get_client('s3')
+    codebuild = get_client('codebuild')
+    lambda_client = get_client('lambda')
+    ecr = get_client('ecr')
     
-    account_id = boto3.client('sts').get_caller_identity()['Account']
+    account_id = get_client('sts').get_caller_identity()['Account']
     region = boto3.session.Session().region_name or 'us-east-1'
     bucket_name = f'agent-core-configs-{account_id}'
     repo_name = 'agent-core-tools'
     
     # Package source
     print("📦 Packaging source...")
+    sources = ['tool_executor.py', 'Dockerfile', 'buildspec.yml']
+    if os.path.exists('requirements.txt'):
+        sources.append('requirements.txt')
+    
+    # Deflate buys nothing on a few small text files; only compress large sources
+    total_size = sum(os.path.getsize(path) for path in sources)
+    compression = zipfile.ZIP_DEFLATED if total_size > 1024 * 1024 else zipfile.ZIP_STORED
+    
     zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.write('tool_executor.py')
-        zf.write('Dockerfile')
-        zf.write('buildspec.yml')
-        if os.path.exists('requirements.txt'):
-            zf.write('requirements.txt')
+    with zipfile.ZipFile(zip_buffer, 'w', compression) as zf:
+        for path in sources:
+            zf.write(path)
     
     s3.put_object(Bucket=bucket_name, Key='source.zip', Body=zip_buffer.getvalue())
     print("✓ Uploaded to S3")
@@ -39,8 +48,21 @@ def deploy():
     
     # Wait for build
     print("⏳ Building (2-3 minutes)...")
+    delay = 2
+    throttles = 0
     while True:
-        response = codebuild.batch_get_builds(ids=[build_id])
+        try:
+            response = codebuild.batch_get_builds(ids=[build_id])
+        except ClientError as e:
+            # botocore has already retried; give up after a few more throttled polls
+            throttles += 1
+            if e.response['Error']['Code'] != 'ThrottlingException' or throttles > 5:
+                raise
+            # Equal jitter: half the backoff fixed, half random
+            backoff = min(2 ** throttles, 30)
+            time.sleep(backoff / 2 + random.uniform(0, backoff / 2))
+            continue
+        throttles = 0
         status = response['builds'][0]['buildStatus']
         
         if status == 'SUCCEEDED':
@@ -50,20 +72,22 @@ def deploy():
             print(f"❌ Build failed: {status}")
             return False
         
-        time.sleep(15)
+        time.sleep(delay)
+        delay = min(delay * 1.5, 15)
     
     # Wait for EventBridge + Lambda
     print("⏳ Waiting for auto-deploy Lambda...")
     time.sleep(10)
     
     # Get latest image
-    images = ecr.describe_images(repositoryName=repo_name, maxResults=1)
-    image_digest = images['imageDetails'][0]['imageDigest']
+    # buildspec.yml pushes IMAGE_TAG=latest, so resolve that tag directly
+    resp = ecr.batch_get_image(repositoryName=repo_name, imageIds=[{'imageTag': 'latest'}])
+    image_digest = resp['images'][0]['imageId']['imageDigest']
     image_uri = f"{account_id}.dkr.ecr.{region}.amazonaws.com/{repo_name}@{image_digest}"
     
     # Create/update tool executor Lambda
     function_name = 'AgentCoreToolExecutor'
-    role_arn = boto3.client('iam').get_role(RoleName='AgentCoreAutoDeployRole')['Role']['Arn']
+    role_arn = get_client('iam').get_role(RoleName='AgentCoreAutoDeployRole')['Role']['Arn']
     
     try:
         lambda_client.create_function(
@@ -71,13 +95,21 @@ def deploy():
             Role=role_arn,
             Code={'ImageUri': image_uri},
             PackageType='Image',
+            Architectures=['arm64'],
+            MemorySize=256,
             Timeout=60
         )
         print(f"✓ Created Lambda: {function_name}")
     except lambda_client.exceptions.ResourceConflictException:
         lambda_client.update_function_code(
             FunctionName=function_name,
-            ImageUri=image_uri
+            ImageUri=image_uri,
+            Architectures=['arm64']
+        )
+        lambda_client.get_waiter('function_updated_v2').wait(FunctionName=function_name)
+        lambda_client.update_function_configuration(
+            FunctionName=function_name,
+            MemorySize=256
         )
         print(f"✓ Updated Lambda: {function_name}")
     
@@ -1,33 +1,47 @@
 #!/usr/bin/env python3
 """Setup infrastructure for auto-creating Bedrock Agents on ECR push"""
 
+import base64
 import boto3
+import hashlib
 import json
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from botocore.exceptions import ClientError
 
-def setup():
-    ecr = boto3.client('ecr')
-    s3 = boto3.client('s3')
-    iam = boto3.client('iam')
-    lambda_client = boto3.client('lambda')
-    events = boto3.client('events')
-    codebuild = boto3.client('codebuild')
-    
-    account_id = boto3.client('sts').get_caller_identity()['Account']
-    region = boto3.session.Session().region_name or 'us-east-1'
-    
-    # 1. Create ECR repository
-    repo_name = 'agent-core-tools'
+from clients import get_client
+
+def trust_policy(service):
+    return {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Principal": {"Service": service},
+            "Action": "sts:AssumeRole"
+        }]
+    }
+
+def retry_on_role_error(call, **kwargs):
+    """Retry `call` while a newly created IAM role is still propagating"""
+    for attempt in range(10):
+        try:
+            return call(**kwargs)
+        except ClientError as e:
+            if attempt == 9 or 'role' not in str(e).lower() or e.response['Error']['Code'] not in (
+                    'InvalidParameterValueException', 'InvalidInputException', 'AccessDeniedException'):
+                raise
+            time.sleep(min(2 ** attempt, 16))
+
+def create_ecr_repo(ecr, repo_name):
     try:
         ecr.create_repository(repositoryName=repo_name)
         print(f"✓ Created ECR: {repo_name}")
     except ecr.exceptions.RepositoryAlreadyExistsException:
         print(f"✓ ECR exists: {repo_name}")
-    
-    # 2. Create S3 bucket
-    bucket_name = f'agent-core-configs-{account_id}'
+
+def create_bucket(s3, bucket_name, region):
     try:
         if region == 'us-east-1':
             s3.create_bucket(Bucket=bucket_name)
@@ -36,30 +50,22 @@ def setup():
         print(f"✓ Created S3: {bucket_name}")
     except:
         print(f"✓ S3 exists: {bucket_name}")
-    
-    # 3. Create Bedrock Agent execution role
-    agent_role_name = 'BedrockAgentCoreExecutionRole'
-    agent_trust_policy = {
-        "Version": "2012-10-17",
-        "Statement": [{
-            "Effect": "Allow",
-            "Principal": {"Service": "bedrock.amazonaws.com"},
-            "Action": "sts:AssumeRole"
-        }]
-    }
-    
+
+def create_role(iam, role_name, service, label):
+    """Create an IAM role trusted by `service`, returning its ARN"""
     try:
-        agent_role_response = iam.create_role(
-            RoleName=agent_role_name,
-            AssumeRolePolicyDocument=json.dumps(agent_trust_policy)
+        role_response = iam.create_role(
+            RoleName=role_name,
+            AssumeRolePolicyDocument=json.dumps(trust_policy(service))
         )
-        agent_role_arn = agent_role_response['Role']['Arn']
-        print(f"✓ Created agent role: {agent_role_name}")
-        time.sleep(10)
+        role_arn = role_response['Role']['Arn']
+        print(f"✓ {label} created: {role_name}")
     except iam.exceptions.EntityAlreadyExistsException:
-        agent_role_arn = iam.get_role(RoleName=agent_role_name)['Role']['Arn']
-        print(f"✓ Agent role exists: {agent_role_name}")
-    
+        role_arn = iam.get_role(RoleName=role_name)['Role']['Arn']
+        print(f"✓ {label} exists: {role_name}")
+    return role_arn
+
+def configure_agent_role(iam, agent_role_name, region, account_id):
     iam.attach_role_policy(
         RoleName=agent_role_name,
         PolicyArn='arn:aws:iam::aws:policy/AmazonBedrockFullAccess'
@@ -78,31 +84,8 @@ def setup():
             }]
         })
     )
-    
-    # 4. Create Lambda execution role
-    lambda_role_name = 'AgentCoreAutoDeployRole'
-    lambda_trust_policy = {
-        "Version": "2012-10-17",
-        "Statement": [{
-            "Effect": "Allow",
-            "Principal": {"Service": "lambda.amazonaws.com"},
-            "Action": "sts:AssumeRole"
-        }]
-    }
-    
-    try:
-        role_response = iam.create_role(
-            RoleName=lambda_role_name,
-            AssumeRolePolicyDocument=json.dumps(lambda_trust_policy)
-        )
-        role_arn = role_response['Role']['Arn']
-        print(f"✓ Created Lambda role: {lambda_role_name}")
-        time.sleep(10)
-    except iam.exceptions.EntityAlreadyExistsException:
-        role_arn = iam.get_role(RoleName=lambda_role_name)['Role']['Arn']
-        print(f"✓ Lambda role exists: {lambda_role_name}")
-    
-    # Attach policies
+
+def configure_lambda_role(iam, lambda_role_name, agent_role_arn, bucket_name, region, account_id):
     policy = {
         "Version": "2012-10-17",
         "Statement": [
@@ -168,21 +151,8 @@ def setup():
         iam.put_role_policy(RoleName=lambda_role_name, PolicyName='AgentCorePolicy', PolicyDocument=json.dumps(policy))
     except:
         pass
-    
-    # 5. Create tool executor Lambda role
-    tool_role_name = 'AgentCoreToolExecutorRole'
-    try:
-        tool_role_response = iam.create_role(
-            RoleName=tool_role_name,
-            AssumeRolePolicyDocument=json.dumps(lambda_trust_policy)
-        )
-        tool_role_arn = tool_role_response['Role']['Arn']
-        print(f"✓ Created tool executor role: {tool_role_name}")
-        time.sleep(10)
-    except iam.exceptions.EntityAlreadyExistsException:
-        tool_role_arn = iam.get_role(RoleName=tool_role_name)['Role']['Arn']
-        print(f"✓ Tool executor role exists: {tool_role_name}")
-    
+
+def configure_tool_role(iam, tool_role_name, region, account_id):
     iam.attach_role_policy(
         RoleName=tool_role_name,
         PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
@@ -205,77 +175,126 @@ def setup():
             }]
         })
     )
-    
-    # 6. Create auto-deploy Lambda
+
+def configure_codebuild_role(iam, codebuild_role, bucket_name, region, account_id):
+    iam.put_role_policy(
+        RoleName=codebuild_role,
+        PolicyName='CodeBuildPolicy',
+        PolicyDocument=json.dumps({
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Effect": "Allow",
+                    "Action": [
+                        "ecr:GetAuthorizationToken",
+                        "ecr:BatchCheckLayerAvailability",
+                        "ecr:GetDownloadUrlForLayer",
+                        "ecr:BatchGetImage",
+                        "ecr:PutImage",
+                        "ecr:InitiateLayerUpload",
+                        "ecr:UploadLayerPart",
+                        "ecr:CompleteLayerUpload"
+                    ],
+                    "Resource": "*"
+                },
+                {
+                    "Effect": "Allow",
+                    "Action": [
+                        "s3:GetObject",
+                        "s3:GetObjectVersion"
+                    ],
+                    "Resource": f"arn:aws:s3:::{bucket_name}/source.zip"
+                },
+                {
+                    "Effect": "Allow",
+                    "Action": [
+                        "logs:CreateLogGroup",
+                        "logs:CreateLogStream",
+                        "logs:PutLogEvents"
+                    ],
+                    "Resource": f"arn:aws:logs:{region}:{account_id}:log-group:/aws/codebuild/agent-core-builder:*"
+                }
+            ]
+        })
+    )
+
+def build_auto_deploy_zip():
+    """Zip the auto-deploy Lambda with fixed timestamps so unchanged code hashes the same"""
     with open('auto_deploy_lambda.py', 'r') as f:
         code = f.read()
+    with open('clients.py', 'r') as f:
+        clients_code = f.read()
     
     zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr('lambda_function.py', code)
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for name, source in [('lambda_function.py', code), ('clients.py', clients_code)]:
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, source)
+    return zip_buffer.getvalue()
+
+def create_auto_deploy_lambda(lambda_client, function_name, role_arn, bucket_name, repo_name, agent_role_arn):
+    zip_bytes = build_auto_deploy_zip()
+    environment = {
+        'Variables': {
+            'S3_BUCKET': bucket_name,
+            'ECR_REPO': repo_name,
+            'AGENT_ROLE_ARN': agent_role_arn
+        }
+    }
     
-    function_name = 'AgentCoreAutoDeployer'
+    # Look the function up first so an unchanged package is never uploaded
     try:
-        lambda_response = lambda_client.create_function(
+        config = lambda_client.get_function_configuration(FunctionName=function_name)
+    except lambda_client.exceptions.ResourceNotFoundException:
+        lambda_response = retry_on_role_error(
+            lambda_client.create_function,
             FunctionName=function_name,
             Runtime='python3.12',
             Role=role_arn,
             Handler='lambda_function.lambda_handler',
-            Code={'ZipFile': zip_buffer.getvalue()},
+            Code={'ZipFile': zip_bytes},
             Timeout=300,
-            Environment={
-                'Variables': {
-                    'S3_BUCKET': bucket_name,
-                    'ECR_REPO': repo_name,
-                    'AGENT_ROLE_ARN': agent_role_arn
-                }
-            }
+            Environment=environment
         )
-        lambda_arn = lambda_response['FunctionArn']
         print(f"✓ Created Lambda: {function_name}")
-    except lambda_client.exceptions.ResourceConflictException:
-        # Update code
+        return lambda_response['FunctionArn']
+    
+    updated = False
+    
+    # Update code only if the package changed
+    local_sha = base64.b64encode(hashlib.sha256(zip_bytes).digest()).decode()
+    if local_sha != config['CodeSha256']:
         try:
             lambda_client.update_function_code(
                 FunctionName=function_name,
-                ZipFile=zip_buffer.getvalue()
+                ZipFile=zip_bytes
             )
-            time.sleep(5)
+            lambda_client.get_waiter('function_updated_v2').wait(FunctionName=function_name)
+            updated = True
         except:
-            pass
-        
-        # Update config
+            print(f"⚠️  Could not update Lambda code: {function_name}")
+    
+    # Update config only if it drifted
+    if config.get('Timeout') != 300 or config.get('Environment', {}).get('Variables') != environment['Variables']:
         try:
             lambda_client.update_function_configuration(
                 FunctionName=function_name,
                 Timeout=300,
-                Environment={
-                    'Variables': {
-                        'S3_BUCKET': bucket_name,
-                        'ECR_REPO': repo_name,
-                        'AGENT_ROLE_ARN': agent_role_arn
-                    }
-                }
+                Environment=environment
             )
+            updated = True
         except:
-            pass
-        
-        lambda_arn = lambda_client.get_function(FunctionName=function_name)['Configuration']['FunctionArn']
-        print(f"✓ Updated Lambda: {function_name}")
+            print(f"⚠️  Could not update Lambda config: {function_name}")
     
-    # 7. Add EventBridge permission
-    try:
-        lambda_client.add_permission(
-            FunctionName=function_name,
-            StatementId='AllowEventBridge',
-            Action='lambda:InvokeFunction',
-            Principal='events.amazonaws.com'
-        )
-    except:
-        pass
+    if updated:
+        print(f"✓ Updated Lambda: {function_name}")
+    else:
+        print(f"✓ Lambda up to date: {function_name}")
     
-    # 8. Create EventBridge rule
-    rule_name = 'AgentCoreECRPushTrigger'
+    return config['FunctionArn']
+
+def create_event_rule(events, rule_name, repo_name):
     event_pattern = {
         "source": ["aws.ecr"],
         "detail-type": ["ECR Image Action"],
@@ -295,93 +314,118 @@ def setup():
         print(f"✓ Created EventBridge rule: {rule_name}")
     except:
         print(f"✓ EventBridge rule exists: {rule_name}")
-    
-    events.put_targets(Rule=rule_name, Targets=[{'Id': '1', 'Arn': lambda_arn}])
-    
-    # 9. Create CodeBuild project
-    codebuild_role = 'AgentCoreCodeBuildRole'
+
+def create_codebuild_project(codebuild, project_name, bucket_name, repo_name, cb_role_arn, region, account_id):
+    # Reuse Docker layers between builds on the same host
+    cache = {'type': 'LOCAL', 'modes': ['LOCAL_DOCKER_LAYER_CACHE']}
+    # Build natively on arm64 to match the Dockerfile platform
+    environment = {
+        'type': 'ARM_CONTAINER',
+        'image': 'aws/codebuild/amazonlinux2-aarch64-standard:3.0',
+        'computeType': 'BUILD_GENERAL1_SMALL',
+        'privilegedMode': True,
+        'environmentVariables': [
+            {'name': 'AWS_DEFAULT_REGION', 'value': region},
+            {'name': 'AWS_ACCOUNT_ID', 'value': account_id},
+            {'name': 'IMAGE_REPO_NAME', 'value': repo_name},
+            {'name': 'IMAGE_TAG', 'value': 'latest'}
+        ]
+    }
     try:
-        cb_role_response = iam.create_role(
-            RoleName=codebuild_role,
-            AssumeRolePolicyDocument=json.dumps({
-                "Version": "2012-10-17",
-                "Statement": [{
-                    "Effect": "Allow",
-                    "Principal": {"Service": "codebuild.amazonaws.com"},
-                    "Action": "sts:AssumeRole"
-                }]
-            })
+        retry_on_role_error(
+            codebuild.create_project,
+            name=project_name,
+            source={'type': 'S3', 'location': f'{bucket_name}/source.zip'},
+            artifacts={'type': 'NO_ARTIFACTS'},
+            environment=environment,
+            serviceRole=cb_role_arn,
+            cache=cache
         )
-        time.sleep(10)
+        print(f"✓ Created CodeBuild: {project_name}")
+    except codebuild.exceptions.ResourceAlreadyExistsException:
+        # Migrate projects created before the arm64 build and caching
+        try:
+            codebuild.update_project(name=project_name, environment=environment, cache=cache)
+            print(f"✓ Updated CodeBuild: {project_name}")
+        except:
+            print(f"⚠️  Could not update CodeBuild: {project_name}")
     except:
-        pass
-    
-    iam.put_role_policy(
-        RoleName=codebuild_role,
-        PolicyName='CodeBuildPolicy',
-        PolicyDocument=json.dumps({
-            "Version": "2012-10-17",
-            "Statement": [
-                {
-                    "Effect": "Allow",
-                    "Action": [
-                        "ecr:GetAuthorizationToken",
-                        "ecr:BatchCheckLayerAvailability",
-                        "ecr:GetDownloadUrlForLayer",
-                        "ecr:BatchGetImage",
-                        "ecr:PutImage",
-                        "ecr:InitiateLayerUpload",
-                        "ecr:UploadLayerPart",
-                        "ecr:CompleteLayerUpload"
-                    ],
-                    "Resource": "*"
-                },
-                {
-                    "Effect": "Allow",
-                    "Action": [
-                        "s3:GetObject",
-                        "s3:GetObjectVersion"
-                    ],
-                    "Resource": f"arn:aws:s3:::{bucket_name}/source.zip"
-                },
-                {
-                    "Effect": "Allow",
-                    "Action": [
-                        "logs:CreateLogGroup",
-                        "logs:CreateLogStream",
-                        "logs:PutLogEvents"
-                    ],
-                    "Resource": f"arn:aws:logs:{region}:{account_id}:log-group:/aws/codebuild/agent-core-builder:*"
-                }
-            ]
-        })
-    )
+        print(f"✓ CodeBuild exists: {project_name}")
+
+def setup():
+    ecr = get_client('ecr')
+    s3 = get_client('s3')
+    iam = get_client('iam')
+    lambda_client = get_client('lambda')
+    events = get_client('events')
+    codebuild = get_client('codebuild')
     
-    cb_role_arn = iam.get_role(RoleName=codebuild_role)['Role']['Arn']
+    account_id = get_client('sts').get_caller_identity()['Account']
+    region = boto3.session.Session().region_name or 'us-east-1'
     
+    repo_name = 'agent-core-tools'
+    bucket_name = f'agent-core-configs-{account_id}'
+    agent_role_name = 'BedrockAgentCoreExecutionRole'
+    lambda_role_name = 'AgentCoreAutoDeployRole'
+    tool_role_name = 'AgentCoreToolExecutorRole'
+    codebuild_role = 'AgentCoreCodeBuildRole'
+    function_name = 'AgentCoreAutoDeployer'
+    rule_name = 'AgentCoreECRPushTrigger'
     project_name = 'agent-core-builder'
+    
+    # Independent calls run concurrently in three dependency stages
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        # Stage A: ECR repository, S3 bucket and IAM roles
+        stage_a = [
+            ex.submit(create_ecr_repo, ecr, repo_name),
+            ex.submit(create_bucket, s3, bucket_name, region)
+        ]
+        agent_role = ex.submit(create_role, iam, agent_role_name, 'bedrock.amazonaws.com', 'Agent role')
+        lambda_role = ex.submit(create_role, iam, lambda_role_name, 'lambda.amazonaws.com', 'Lambda role')
+        tool_role = ex.submit(create_role, iam, tool_role_name, 'lambda.amazonaws.com', 'Tool executor role')
+        cb_role = ex.submit(create_role, iam, codebuild_role, 'codebuild.amazonaws.com', 'CodeBuild role')
+        
+        agent_role_arn = agent_role.result()
+        role_arn = lambda_role.result()
+        tool_role.result()
+        cb_role_arn = cb_role.result()
+        for future in stage_a:
+            future.result()
+        
+        # Stage B: role policies
+        stage_b = [
+            ex.submit(configure_agent_role, iam, agent_role_name, region, account_id),
+            ex.submit(configure_lambda_role, iam, lambda_role_name, agent_role_arn, bucket_name, region, account_id),
+            ex.submit(configure_tool_role, iam, tool_role_name, region, account_id),
+            ex.submit(configure_codebuild_role, iam, codebuild_role, bucket_name, region, account_id)
+        ]
+        for future in stage_b:
+            future.result()
+        
+        # Stage C: auto-deploy Lambda, EventBridge rule and CodeBuild project
+        auto_deploy = ex.submit(create_auto_deploy_lambda, lambda_client, function_name,
+                                role_arn, bucket_name, repo_name, agent_role_arn)
+        stage_c = [
+            ex.submit(create_event_rule, events, rule_name, repo_name),
+            ex.submit(create_codebuild_project, codebuild, project_name, bucket_name,
+                      repo_name, cb_role_arn, region, account_id)
+        ]
+        lambda_arn = auto_deploy.result()
+        for future in stage_c:
+            future.result()
+    
+    # Add EventBridge permission
     try:
-        codebuild.create_project(
-            name=project_name,
-            source={'type': 'S3', 'location': f'{bucket_name}/source.zip'},
-            artifacts={'type': 'NO_ARTIFACTS'},
-            environment={
-                'type': 'LINUX_CONTAINER',
-                'image': 'aws/codebuild/standard:7.0',
-                'computeType': 'BUILD_GENERAL1_SMALL',
-                'privilegedMode': True,
-                'environmentVariables': [
-                    {'name': 'AWS_DEFAULT_REGION', 'value': region},
-                    {'name': 'AWS_ACCOUNT_ID', 'value': account_id},
-                    {'name': 'IMAGE_REPO_NAME', 'value': repo_name},
-                    {'name': 'IMAGE_TAG', 'value': 'latest'}
-                ]
-            },
-            serviceRole=cb_role_arn
+        lambda_client.add_permission(
+            FunctionName=function_name,
+            StatementId='AllowEventBridge',
+            Action='lambda:InvokeFunction',
+            Principal='events.amazonaws.com'
         )
-        print(f"✓ Created CodeBuild: {project_name}")
     except:
-        print(f"✓ CodeBuild exists: {project_name}")
+        pass
+    
+    events.put_targets(Rule=rule_name, Targets=[{'Id': '1', 'Arn': lambda_arn}])
     
     print("\n" + "="*60)
     print("SETUP COMPLETE!")
@@ -3,15 +3,20 @@
 
 import boto3
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
 
 # Get latest agent
 bedrock = boto3.client('bedrock-agent')
-agents = bedrock.list_agents()
-latest_agent = sorted(
-    [a for a in agents['agentSummaries'] if a['agentName'].startswith('agent-core-')],
-    key=lambda x: x['updatedAt'],
-    reverse=True
-)[0]
+summaries = (
+    a
+    for page in bedrock.get_paginator('list_agents').paginate()
+    for a in page['agentSummaries']
+)
+latest_agent = max(
+    (a for a in summaries if a['agentName'].startswith('agent-core-')),
+    key=lambda x: x['updatedAt']
+)
 
 agent_id = latest_agent['agentId']
 agent_name = latest_agent['agentName']
@@ -20,76 +25,41 @@ print(f"🤖 Testing Agent: {agent_name}")
 print(f"   Agent ID: {agent_id}")
 print(f"   Status: {latest_agent['agentStatus']}\n")
 
-# Test the new get_time tool
-print("=" * 60)
-print("TEST 1: Get time in New York")
-print("=" * 60)
-
-bedrock_runtime = boto3.client('bedrock-agent-runtime')
+bedrock_runtime = boto3.client('bedrock-agent-runtime', config=Config(max_pool_connections=10))
 
-try:
-    response = bedrock_runtime.invoke_agent(
-        agentId=agent_id,
-        agentAliasId='TSTALIASID',
-        sessionId='test-time-1',
-        inputText='What time is it in New York?'
-    )
-    
-    print("Response:")
-    for event in response['completion']:
-        if 'chunk' in event:
-            chunk = event['chunk']
-            if 'bytes' in chunk:
-                print(chunk['bytes'].decode(), end='')
-    print("\n")
-except Exception as e:
-    print(f"Error: {e}\n")
+def run_test(session_id, prompt, title):
+    """Invoke the agent and return the header and collected response text"""
+    output = "=" * 60 + f"\n{title}\n" + "=" * 60 + "\n"
+    try:
+        response = bedrock_runtime.invoke_agent(
+            agentId=agent_id,
+            agentAliasId='TSTALIASID',
+            sessionId=session_id,
+            inputText=prompt
+        )
+        
+        output += "Response:\n"
+        for event in response['completion']:
+            if 'chunk' in event:
+                chunk = event['chunk']
+                if 'bytes' in chunk:
+                    output += chunk['bytes'].decode()
+        output += "\n"
+    except Exception as e:
+        output += f"Error: {e}\n"
+    return output
 
-# Test weather (existing tool)
-print("=" * 60)
-print("TEST 2: Get weather (existing tool)")
-print("=" * 60)
-
-try:
-    response = bedrock_runtime.invoke_agent(
-        agentId=agent_id,
-        agentAliasId='TSTALIASID',
-        sessionId='test-weather-1',
-        inputText='What is the weather in Tokyo?'
-    )
-    
-    print("Response:")
-    for event in response['completion']:
-        if 'chunk' in event:
-            chunk = event['chunk']
-            if 'bytes' in chunk:
-                print(chunk['bytes'].decode(), end='')
-    print("\n")
-except Exception as e:
-    print(f"Error: {e}\n")
-
-# Test calculate (existing tool)
-print("=" * 60)
-print("TEST 3: Calculate (existing tool)")
-print("=" * 60)
+tests = [
+    ('test-time-1', 'What time is it in New York?', 'TEST 1: Get time in New York'),
+    ('test-weather-1', 'What is the weather in Tokyo?', 'TEST 2: Get weather (existing tool)'),
+    ('test-calc-1', 'What is 123 + 456?', 'TEST 3: Calculate (existing tool)')
+]
 
-try:
-    response = bedrock_runtime.invoke_agent(
-        agentId=agent_id,
-        agentAliasId='TSTALIASID',
-        sessionId='test-calc-1',
-        inputText='What is 123 + 456?'
-    )
-    
-    print("Response:")
-    for event in response['completion']:
-        if 'chunk' in event:
-            chunk = event['chunk']
-            if 'bytes' in chunk:
-                print(chunk['bytes'].decode(), end='')
-    print("\n")
-except Exception as e:
-    print(f"Error: {e}\n")
+# Run the streaming invocations concurrently over the shared client
+with ThreadPoolExecutor(max_workers=3) as ex:
+    futures = [ex.submit(run_test, *test) for test in tests]
+    for future in as_completed(futures):
+        print(future.result())
 
 print("=" * 60)
 print("✅ Testing complete!")
@@ -4,6 +4,63 @@ This is called by Bedrock Agents (not Agent Core client).
 """
 
 import json
+from datetime import datetime
+from functools import cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+@cache
+def _timezone_keys():
+    """Lowercase name -> IANA key, built only when an exact lookup misses"""
+    return {name.lower(): name for name in available_timezones()}
+
+def _zone(name):
+    """Resolve a timezone name case-insensitively like pytz, or return None"""
+    # ZoneInfo caches instances per key, so repeat lookups are cheap
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        pass
+    key = _timezone_keys().get(str(name).lower())
+    return ZoneInfo(key) if key else None
+
+def _param(parameters, name, default=None):
+    """Look up one parameter from the Bedrock list format or a plain dict"""
+    if isinstance(parameters, list):
+        return next((p['value'] for p in parameters if p['name'] == name), default)
+    return parameters.get(name, default)
+
+def _get_weather(parameters):
+    city = _param(parameters, "city", "Unknown")
+    return {
+        "weather": f"Sunny in {city}",
+        "temperature": 72,
+        "humidity": 65
+    }
+
+def _calculate(parameters):
+    a = float(_param(parameters, "a", 0))
+    b = float(_param(parameters, "b", 0))
+    return {"result": a + b}
+
+def _get_time(parameters):
+    timezone = _param(parameters, "timezone", "UTC")
+    tz = _zone(timezone)
+    if tz is None:
+        return {"error": f"Invalid timezone: {timezone}"}
+    current_time = datetime.now(tz)
+    return {
+        "time": current_time.strftime("%I:%M %p"),
+        "date": current_time.strftime("%Y-%m-%d"),
+        "timezone": timezone,
+        "day": current_time.strftime("%A")
+    }
+
+# Tool name -> implementation
+_TOOLS = {
+    "get_weather": _get_weather,
+    "calculate": _calculate,
+    "get_time": _get_time
+}
 
 def lambda_handler(event, context):
     """Execute tool for Bedrock Agent"""
@@ -14,45 +71,11 @@ def lambda_handler(event, context):
     function_name = event.get('function')
     parameters = event.get('parameters', [])
     
-    # Convert parameters to dict
-    params = {p['name']: p['value'] for p in parameters} if isinstance(parameters, list) else parameters
-    
     # Determine tool name
     tool_name = function_name or (api_path.strip('/') if api_path else None)
     
-    # Tool implementations
-    if tool_name == "get_weather":
-        city = params.get("city", "Unknown")
-        result = {
-            "weather": f"Sunny in {city}",
-            "temperature": 72,
-            "humidity": 65
-        }
-    
-    elif tool_name == "calculate":
-        a = float(params.get("a", 0))
-        b = float(params.get("b", 0))
-        result = {"result": a + b}
-    
-    elif tool_name == "get_time":
-        from datetime import datetime
-        import pytz
-        
-        timezone = params.get("timezone", "UTC")
-        try:
-            tz = pytz.timezone(timezone)
-            current_time = datetime.now(tz)
-            result = {
-                "time": current_time.strftime("%I:%M %p"),
-                "date": current_time.strftime("%Y-%m-%d"),
-                "timezone": timezone,
-                "day": current_time.strftime("%A")
-            }
-        except:
-            result = {"error": f"Invalid timezone: {timezone}"}
-    
-    else:
-        result = {"error": f"Unknown tool: {tool_name}"}
+    handler = _TOOLS.get(tool_name)
+    result = handler(parameters) if handler else {"error": f"Unknown tool: {tool_name}"}
     
     # Return in Bedrock Agent format
     return {